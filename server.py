@@ -8,8 +8,20 @@ from flask_cors import CORS
 from werkzeug.utils import secure_filename
 import os
 import json
+import math
+import mmap
+import struct
+import hashlib
+import threading
+import time
 from datetime import datetime
 
+try:
+    import fcntl
+except ImportError:  # Windows: lock di un byte del file con msvcrt
+    fcntl = None
+    import msvcrt
+
 app = Flask(__name__, 
             static_folder='.',
             template_folder='.')
@@ -29,6 +41,186 @@ app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # Max 16MB
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def get_request_ip():
+    """IP del client (stessa logica di /api/ip)"""
+    return request.headers.get('X-Forwarded-For', request.remote_addr)
+
+# ========== Rate Limiting ==========
+
+# Limiti per le POST: (prefisso path, bucket, limite per IP, limite globale)
+# Ogni limite è (richieste, finestra in secondi). Il limite globale è condiviso
+# da tutti i client della regola, così regge anche con X-Forwarded-For falsificato.
+# Le route admin non hanno limite globale: senza autenticazione chiunque
+# potrebbe esaurirlo e impedire all'admin di salvare
+RATE_LIMIT_RULES = [
+    ('/api/contact', 'contact', (5, 60), (60, 60)),
+    ('/api/newsletter', 'newsletter', (3, 60), (30, 60)),
+    ('/api/upload/strategy-attachment', 'upload', (10, 300), (30, 300)),
+    ('/api/delete/strategy-attachment', 'admin', (30, 60), None),
+    ('/api/config/', 'admin', (30, 60), None),
+]
+RATE_LIMIT_FILE = os.environ.get(
+    'LINEARITY_RATELIMIT_FILE',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '.ratelimit.bin')
+)
+RATE_LIMIT_SLOTS = 8192
+
+
+class SharedRateLimiter:
+    """Token bucket salvati in una tabella mmap condivisa tra processi.
+
+    Ogni slot contiene (hash chiave, token, ultimo aggiornamento, finestra).
+    I bucket per IP usano probing lineare nella zona principale; uno slot è
+    riutilizzabile solo quando il suo bucket è tornato pieno. I bucket globali
+    hanno slot fissi in coda alla tabella, così non possono essere scalzati.
+    """
+
+    SLOT = struct.Struct('<Qddd')
+    MAX_PROBES = 8
+
+    def __init__(self, path, slots, shared_buckets):
+        self.path = path
+        self.slots = slots
+        self.shared = {
+            name: slots + i for i, name in enumerate(dict.fromkeys(shared_buckets))
+        }
+        self.size = (slots + len(self.shared)) * self.SLOT.size
+        self._lock = threading.Lock()
+        self._pid = None
+        self._fd = None
+        self._map = None
+        self._warned = False
+
+    def _open(self):
+        # Riapri dopo un fork: flock è legato al file descriptor, quindi ogni
+        # worker deve avere il proprio per escludere gli altri processi
+        if self._map is not None:
+            self._map.close()
+            os.close(self._fd)
+            self._map = None
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if os.fstat(fd).st_size < self.size:
+                os.ftruncate(fd, self.size)
+            self._map = mmap.mmap(fd, self.size)
+        except OSError:
+            os.close(fd)
+            raise
+        self._fd = fd
+        self._pid = os.getpid()
+
+    def _acquire(self):
+        if fcntl:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        else:
+            # Su Windows si blocca un byte oltre la tabella, fuori dalla mappa
+            os.lseek(self._fd, self.size, os.SEEK_SET)
+            msvcrt.locking(self._fd, msvcrt.LK_LOCK, 1)
+
+    def _release(self):
+        if fcntl:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        else:
+            os.lseek(self._fd, self.size, os.SEEK_SET)
+            msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+
+    @staticmethod
+    def _key(bucket, client):
+        return int.from_bytes(
+            hashlib.blake2b(f'{bucket}|{client}'.encode(), digest_size=8).digest(), 'little'
+        ) or 1
+
+    def check(self, bucket, client, ip_limit, route_limit=None):
+        """Consuma un token per IP e uno globale; 0 se permesso, altrimenti i secondi di attesa"""
+        now = time.time()
+        with self._lock:
+            try:
+                if self._pid != os.getpid():
+                    self._open()
+                self._acquire()
+                try:
+                    return self._check(bucket, client, ip_limit, route_limit, now)
+                finally:
+                    self._release()
+            except OSError as e:
+                # Meglio lasciar passare la richiesta che rompere gli endpoint
+                if not self._warned:
+                    print(f"⚠️ Rate limit disattivato ({self.path}): {e}")
+                    self._warned = True
+                return 0
+
+    def _check(self, bucket, client, ip_limit, route_limit, now):
+        # Nulla viene scritto finché entrambi i bucket non permettono la richiesta
+        ip_key = self._key(bucket, client)
+        ip_offset = self._find(ip_key, now)
+        if ip_offset is not None:
+            ip_tokens = self._tokens(ip_offset, ip_key, now, *ip_limit)
+            if ip_tokens < 1:
+                return (1 - ip_tokens) * ip_limit[1] / ip_limit[0]
+        if route_limit:
+            route_key = self._key(bucket, '*')
+            route_offset = self.shared[bucket] * self.SLOT.size
+            route_tokens = self._tokens(route_offset, route_key, now, *route_limit)
+            if route_tokens < 1:
+                return (1 - route_tokens) * route_limit[1] / route_limit[0]
+            self.SLOT.pack_into(self._map, route_offset, route_key, route_tokens - 1, now, route_limit[1])
+        # Zona per IP satura: decide solo il bucket globale
+        if ip_offset is not None:
+            self.SLOT.pack_into(self._map, ip_offset, ip_key, ip_tokens - 1, now, ip_limit[1])
+        return 0
+
+    def _find(self, key, now):
+        """Offset dello slot della chiave o di uno riutilizzabile; None se satura"""
+        start = key % self.slots
+        target = None
+        for i in range(self.MAX_PROBES):
+            offset = ((start + i) % self.slots) * self.SLOT.size
+            slot_key, _, updated, horizon = self.SLOT.unpack_from(self._map, offset)
+            if slot_key == key:
+                return offset
+            if target is None and (slot_key == 0 or now - updated > horizon):
+                # Slot vuoto o bucket già tornato pieno
+                target = offset
+        return target
+
+    def _tokens(self, offset, key, now, capacity, period):
+        slot_key, tokens, updated, _ = self.SLOT.unpack_from(self._map, offset)
+        if slot_key != key:
+            return capacity
+        elapsed = max(0.0, now - updated)
+        return min(capacity, tokens + elapsed * capacity / period)
+
+
+rate_limiter = SharedRateLimiter(
+    RATE_LIMIT_FILE,
+    RATE_LIMIT_SLOTS,
+    [bucket for _, bucket, _, route_limit in RATE_LIMIT_RULES if route_limit]
+)
+
+def rate_limited(wait):
+    """Risposta 429 con Retry-After"""
+    response = jsonify({
+        'success': False,
+        'error': 'Troppe richieste, riprova più tardi'
+    })
+    response.status_code = 429
+    response.headers['Retry-After'] = str(max(1, math.ceil(wait)))
+    return response
+
+@app.before_request
+def apply_rate_limit():
+    """Applica i limiti alle POST prima di leggere il body della richiesta"""
+    if request.method != 'POST':
+        return None
+    path = request.path
+    for prefix, bucket, ip_limit, route_limit in RATE_LIMIT_RULES:
+        if path.startswith(prefix):
+            wait = rate_limiter.check(bucket, get_request_ip(), ip_limit, route_limit)
+            if wait:
+                return rate_limited(wait)
+            return None
+    return None
+
 @app.route('/')
 def index():
     """Landing page principale"""
@@ -529,7 +721,7 @@ def health_check():
 @app.route('/api/ip')
 def get_client_ip():
     """Ottieni IP del client (per test geolocalizzazione)"""
-    ip = request.headers.get('X-Forwarded-For', request.remote_addr)
+    ip = get_request_ip()
     return jsonify({
         'ip': ip,
         'user_agent': request.headers.get('User-Agent')